@@ -16,7 +16,10 @@ signal.signal(signal.SIGINT, signal_handler)
 
 try:
     while True:
-        print(c.latest("randcam")[0].shape)
+        frame = c.latest("randcam", timeout=1.0)
+        if frame is None:
+            continue
+        print(frame[0].shape)
 except KeyboardInterrupt:
     print('\nKeyboard interrupt received, exiting...')
     c.close()
\ No newline at end of file
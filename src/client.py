@@ -2,48 +2,92 @@
 from .memory import SharedFrame
 from functools import partial
 import threading
-import uuid
-from collections import deque
+import queue
+import tempfile
+import os
 import numpy as np
 import itertools
 class Client:
+    _ids = itertools.count()
     def __init__(self,name = ''):
         if name:
             from redis import Redis
             self.redis_client = Redis()
-        self.id = str(uuid.uuid4())[:8]
+            # report() only enqueues; a background thread pays the Redis round trips
+            self._reports = queue.SimpleQueue()
+            self._report_error = None
+            self._reporter = threading.Thread(target=self._flush_reports, daemon=True)
+            self._reporter.start()
+        # Unique among live processes on this host, which is all the semaphore names need
+        self.id = f"{os.getpid():x}-{next(Client._ids):x}"
         self.name = name
         self.resources = {}
-        self.res = {}
-        self.update = {}
+        self.shapes = {}
+        self.dtypes = {}
+        self.frames = {}
+        self.stamps = {}
+        self.head = {}
+        self._cv = threading.Condition()
+        self._ready = 0
+        self._bits = {}
         self.concat = {}
-        self.running = True
+        self._latest = {}
+        self._locks = {}
+        self.stopped = threading.Event()
         self.threads = []
-    def request(self, model, buf=None):
+        self._closed = False
+    def request(self, model, buf=None, backing=None):
         if not buf:
             buf = 10
         else:
             self.concat[model] = True
-        self.resources[model] = SharedFrame(model, mode="r")
-        self.resources[model].signin(self.id)
-        self.update[model] = threading.Lock()
-        self.update[model].acquire()
-        self.res[model] = deque([(np.zeros(self.resources[model].shape,self.resources[model].dtype),i) for i in range(buf)],maxlen=buf)
+        sf = self.resources[model] = SharedFrame(model, mode="r")
+        sf.signin(self.id)
+        shape, dtype = self.shapes[model], self.dtypes[model] = tuple(sf.shape), sf.dtype
+        self._bits.setdefault(model, 1 << len(self._bits))
+        self.frames[model] = self._alloc_frames((buf, *shape), dtype, self.concat.get(model, None), backing)
+        self.stamps[model] = np.zeros(buf, np.uint64)
+        self.head[model] = 0
+        # Held while retrive fills a slot and while latest copies out of the ring
+        self._locks[model] = threading.Lock()
+        if self.concat.get(model, None):
+            self._latest[model] = partial(self._latest_concat, model)
+        else:
+            self._latest[model] = partial(self._latest_one, model)
         
+    def _alloc_frames(self, shape, dtype, zero, backing):
+        if backing is None:
+            # Only concat readers can see slots that were never written, so skip the zero fill otherwise
+            return (np.zeros if zero else np.empty)(shape, dtype)
+        # File-backed ring (e.g. backing="/dev/shm"): pages fault in lazily, already zeroed,
+        # and the unlinked file disappears with the mapping
+        with tempfile.TemporaryFile(dir=backing) as f:
+            return np.memmap(f, dtype=dtype, mode="w+", shape=shape)
     def run(self):
         for model in self.resources:
-            thread = threading.Thread(target=partial(self.retrive, model=model))
+            thread = threading.Thread(target=self.retrive, args=(model,))
             thread.start()
             self.threads.append(thread)
             print(f"start retriving {model}")
 
     def retrive(self, model):
-        while self.running:
+        view, frames, stamps, lock, cv, bit = self.resources[model].view, self.frames[model], self.stamps[model], self._locks[model], self._cv, self._bits[model]
+        buf = len(frames)
+        while not self.stopped.is_set():
             try:
-                data, stm = self.resources[model].read(self.id)
-                self.res[model].append((data.copy(), stm))
-                if self.update[model].locked():
-                    self.update[model].release()
+                i = self.head[model]
+                # Bounded wait so close() is noticed even if the producer goes quiet;
+                # the lock is only taken for the copy, never for the wait
+                with view(self.id, timeout=0.5) as res:
+                    if res is None:
+                        continue
+                    with lock:
+                        np.copyto(frames[i], res[0], casting="no")
+                        stamps[i] = res[1]
+                        self.head[model] = (i + 1) % buf
+                with cv:
+                    self._ready |= bit
+                    cv.notify_all()
             except KeyError:
                 # If the semaphore doesn't exist (client signed out), break the loop
                 print(f"Client {self.id} semaphore not found, stopping retrieval for {model}")
@@ -52,12 +96,68 @@ class Client:
                 print(f"Error in retrive for {model}: {e}")
                 break
     def report(self,txt):
-        self.redis_client.rpush(self.name, txt)
-    def latest(self, model):
-        self.update[model].acquire()
-        return np.stack([i[0] for i in list(itertools.islice(self.res[model],len(self.res[model])))]) if self.concat.get(model,None) else self.res[model][-1]
+        if not self._reporter.is_alive():
+            raise RuntimeError(f"report flusher for {self.name} is not running")
+        # A failed flush is raised on the next call, as the synchronous rpush did
+        error, self._report_error = self._report_error, None
+        if error is not None:
+            raise error
+        self._reports.put(txt)
+    def _flush_reports(self):
+        done = False
+        while not done:
+            items = [self._reports.get()]
+            while not self._reports.empty():
+                items.append(self._reports.get_nowait())
+            # None is the shutdown sentinel from close()
+            done = None in items
+            items = [i for i in items if i is not None]
+            if items:
+                try:
+                    self.redis_client.rpush(self.name, *items)
+                except Exception as e:
+                    # Keep flushing later reports; this batch is dropped
+                    print(f"Error reporting {len(items)} items to {self.name}: {e}")
+                    self._report_error = e
+    def latest(self, model, timeout=None, out=None):
+        # Returns fresh arrays; pass out= (shaped like the result) to reuse one instead
+        bit = self._bits[model]
+        with self._cv:
+            if not self._cv.wait_for(lambda: self._ready & bit, timeout):
+                return None
+            self._ready &= ~bit
+        return self._latest[model](out)
+    def latest_any(self, timeout=None):
+        # One wait for whichever models produced since the last call; {} on timeout
+        with self._cv:
+            if not self._cv.wait_for(lambda: self._ready, timeout):
+                return {}
+            ready, self._ready = self._ready, 0
+        return {model: self._latest[model](None) for model, bit in self._bits.items() if ready & bit}
+    def _latest_one(self, model, out=None):
+        # A copy: the ring slot is overwritten once retrive wraps around to it
+        with self._locks[model]:
+            h = self.head[model]
+            frame = self.frames[model][h - 1]
+            if out is None:
+                out = frame.copy()
+            else:
+                np.copyto(out, frame, casting="no")
+            return out, self.stamps[model][h - 1].item()
+    def _latest_concat(self, model, out=None):
+        frames = self.frames[model]
+        # Oldest first; the lock keeps retrive from filling frames[h] while it is being copied
+        with self._locks[model]:
+            h = self.head[model]
+            return np.concatenate((frames[h:], frames[:h]), out=out)
     def close(self):
-        self.running = False
+        if self._closed:
+            return
+        self._closed = True
+        self.stopped.set()
+        if self.name:
+            self._reports.put(None)
+            self._reporter.join(timeout=1.0)
         for res in self.resources.values():
             res.signout(self.id)
         # Wait for all threads to finish
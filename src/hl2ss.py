@@ -1,15 +1,20 @@
 
+from concurrent.futures import ThreadPoolExecutor
 from fractions import Fraction
 
-import io
+import collections
+import mmap
 import numpy as np
+import selectors
 import socket
 import struct
 import time
 import cv2
 import av
 import os
+import queue
 import tarfile
+import threading
 
 
 # Stream TCP Ports
@@ -30,17 +35,24 @@ class StreamPort:
 
 
 # Default Chunk Sizes
+# recv returns as soon as any data is available, so large chunks only cut
+# syscalls on the high bitrate streams and never add latency
 class ChunkSize:
-    RM_VLC               = 1024
-    RM_DEPTH_AHAT        = 4096
-    RM_DEPTH_LONGTHROW   = 4096
+    RM_VLC               = 65536
+    RM_DEPTH_AHAT        = 65536
+    RM_DEPTH_LONGTHROW   = 65536
     RM_IMU_ACCELEROMETER = 2048
     RM_IMU_GYROSCOPE     = 4096
     RM_IMU_MAGNETOMETER  = 256
-    PERSONAL_VIDEO       = 4096
+    PERSONAL_VIDEO       = 65536
     MICROPHONE           = 512
     SPATIAL_INPUT        = 1024
-    SINGLE_TRANSFER      = 4096
+    SINGLE_TRANSFER      = 65536
+
+
+# Kernel receive buffer requested for every stream socket
+# (the kernel caps it at net.core.rmem_max)
+SOCKET_RECEIVE_BUFFER_SIZE = 4 << 20
 
 
 # Stream Operating Mode
@@ -163,6 +175,14 @@ class _SIZEOF:
     FLOAT = 4
 
 
+# Precompiled wire formats
+_PACKET_HEADER       = struct.Struct('<QI')
+_RM_IMU_SAMPLE       = struct.Struct('<QQfff')
+_CONFIGURATION_BYTE  = struct.Struct('<B')
+_CONFIGURATION_VIDEO = struct.Struct('<BHHBBI')
+_TIMESTAMP           = struct.Struct('<Q')
+
+
 #------------------------------------------------------------------------------
 # Network Client
 #------------------------------------------------------------------------------
@@ -170,36 +190,54 @@ class _SIZEOF:
 class client:
     def open(self, host, port):
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Set before connect so the advertised TCP window can use it
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RECEIVE_BUFFER_SIZE)
+        # Configuration and control messages are small; send them without Nagle delay
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self._socket.connect((host, port))
+        self._rxview = memoryview(bytearray(0))
 
     def sendall(self, data):
         self._socket.sendall(data)
 
     def recv(self, chunk_size):
-        chunk = self._socket.recv(chunk_size)
-        if (len(chunk) <= 0):
+        # Returned view is only valid until the next recv call
+        if (chunk_size > len(self._rxview)):
+            self._rxview = memoryview(bytearray(chunk_size))
+        size = self._socket.recv_into(self._rxview, chunk_size)
+        if (size <= 0):
             raise Exception('connection closed')
-        return chunk
+        return self._rxview[:size]
 
-    def download(self, total, chunk_size):
-        data = bytearray()
+    def recv_into(self, buffer, chunk_size):
+        size = self._socket.recv_into(buffer, chunk_size)
+        if (size <= 0):
+            raise Exception('connection closed')
+        return size
 
-        if (chunk_size > total):
-            chunk_size = total
+    def fileno(self):
+        return self._socket.fileno()
 
-        while (total > 0):
-            chunk = self.recv(chunk_size)
-            data.extend(chunk)
-            total -= len(chunk)
-            if (chunk_size > total):
-                chunk_size = total
+    def download(self, total, chunk_size):
+        data = bytearray(total)
+        view = memoryview(data)
+        offset = 0
 
-        if (total != 0):
-            raise Exception('download failed')
+        while (offset < total):
+            size = self._socket.recv_into(view[offset:], min(chunk_size, total - offset))
+            if (size <= 0):
+                raise Exception('connection closed')
+            offset += size
 
+        view.release()
         return data
 
     def close(self):
+        # shutdown wakes a recv blocked in another thread, close alone may not
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self._socket.close()
 
 
@@ -214,34 +252,79 @@ class packet:
         self.pose      = pose
 
     def pack(self, mode):
-        buffer = bytearray()
-        buffer.extend(struct.pack('<QI', self.timestamp, len(self.payload)))
-        buffer.extend(self.payload)
+        size = len(self.payload)
+        end = _PACKET_HEADER.size + size
+        buffer = bytearray(end + (64 if (mode == StreamMode.MODE_1) else 0))
+        _PACKET_HEADER.pack_into(buffer, 0, self.timestamp, size)
+        buffer[_PACKET_HEADER.size:end] = self.payload
         if (mode == StreamMode.MODE_1):
-            buffer.extend(self.pose.tobytes())
+            buffer[end:] = self.pose.tobytes()
         return buffer
 
+    def iov(self, mode):
+        # Same layout as pack, as a buffer list for os.writev (payload not copied)
+        header = _PACKET_HEADER.pack(self.timestamp, len(self.payload))
+        if (mode == StreamMode.MODE_1):
+            return [header, self.payload, self.pose.tobytes()]
+        return [header, self.payload]
+
 
 class unpacker:
+    # Bytes live in _buffer[_cursor:_tail]; the buffer is only compacted or
+    # grown when a write would run past its end
+    INITIAL_CAPACITY = 1 << 20
+
     def __init__(self, mode):
         self._mode = mode
         self._state = 0
-        self._buffer = bytearray()
+        self._buffer = bytearray(unpacker.INITIAL_CAPACITY)
+        self._cursor = 0
+        self._tail = 0
         self._timestamp = None
         self._size = None
         self._payload = None
         self._pose = None
 
+    def _reserve(self, size):
+        if (self._tail + size <= len(self._buffer)):
+            return
+        pending = self._tail - self._cursor
+        if (self._cursor > 0):
+            self._buffer[:pending] = self._buffer[self._cursor:self._tail]
+            self._cursor = 0
+            self._tail = pending
+        if (pending + size > len(self._buffer)):
+            self._buffer.extend(bytes(max(len(self._buffer), pending + size - len(self._buffer))))
+
     def extend(self, chunk):
-        self._buffer.extend(chunk)
+        size = len(chunk)
+        self._reserve(size)
+        self._buffer[self._tail:self._tail + size] = chunk
+        self._tail += size
+
+    def receive(self, client, chunk_size):
+        # recv straight into the free space at the tail, no intermediate chunk
+        self._reserve(chunk_size)
+        with memoryview(self._buffer) as view:
+            self._tail += client.recv_into(view[self._tail:], chunk_size)
+
+    def missing(self):
+        # Bytes still needed to complete the packet whose header was parsed
+        return (self._size - (self._tail - self._cursor)) if (self._state == 1) else 0
+
+    def _consume(self, size):
+        self._cursor += size
+        if (self._cursor >= self._tail):
+            self._cursor = 0
+            self._tail = 0
 
     def unpack(self):        
-        length = len(self._buffer)
+        length = self._tail - self._cursor
         
         while True:
             if (self._state == 0):
                 if (length >= 12):
-                    header = struct.unpack('<QI', self._buffer[:12])
+                    header = _PACKET_HEADER.unpack_from(self._buffer, self._cursor)
                     self._timestamp = header[0]
                     self._size = 12 + header[1]
                     if (self._mode == StreamMode.MODE_1):
@@ -250,13 +333,16 @@ class unpacker:
                     continue
             elif (self._state == 1):
                 if (length >= self._size):
+                    begin = self._cursor
+                    end = begin + self._size
                     if (self._mode == StreamMode.MODE_1):
-                        payload_end = self._size - 64
-                        self._pose = np.frombuffer(self._buffer[payload_end:self._size], dtype=np.float32).reshape((4, 4))
+                        payload_end = end - 64
+                        self._pose = np.frombuffer(self._buffer[payload_end:end], dtype=np.float32).reshape((4, 4))
                     else:
-                        payload_end = self._size
-                    self._payload = self._buffer[12:payload_end]
-                    self._buffer = self._buffer[self._size:]
+                        payload_end = end
+                    # Payload must be a copy: the buffer is overwritten and resized by later receives
+                    self._payload = self._buffer[begin + 12:payload_end]
+                    self._consume(self._size)
                     self._state = 0
                     return True
             return False
@@ -280,11 +366,26 @@ class gatherer:
     def sendall(self, data):
         self._client.sendall(data)
 
+    def _receive(self):
+        # Size the recv to finish a large pending packet in one call
+        self._unpacker.receive(self._client, max(self._chunk_size, self._unpacker.missing()))
+
     def get_next_packet(self):
-        while True:
-            self._unpacker.extend(self._client.recv(self._chunk_size))
-            if (self._unpacker.unpack()):
-                return self._unpacker.get()
+        # Packets left over from an earlier recv are returned without a syscall
+        while (not self._unpacker.unpack()):
+            self._receive()
+        return self._unpacker.get()
+
+    def get_available_packets(self):
+        # One recv, then every packet it completed (possibly none)
+        self._receive()
+        packets = []
+        while (self._unpacker.unpack()):
+            packets.append(self._unpacker.get())
+        return packets
+
+    def fileno(self):
+        return self._client.fileno()
 
     def close(self):
         self._client.close()
@@ -297,47 +398,107 @@ class packet_stream:
     def get_next_packet(self):
         return self._client.get_next_packet()
 
+    def get_available_packets(self):
+        return self._client.get_available_packets()
+
+    def fileno(self):
+        return self._client.fileno()
+
     def close(self):
         return self._client.close()
 
 
+class gatherer_pool:
+    # Services many packet streams from one thread: a single select wakes for
+    # every socket with data instead of one blocked thread per stream.
+    # Streams added here must not also be read with get_next_packet.
+    def open(self):
+        self._selector = selectors.DefaultSelector()
+
+    def add(self, stream):
+        self._selector.register(stream, selectors.EVENT_READ)
+
+    def remove(self, stream):
+        self._selector.unregister(stream)
+
+    def get_next_packets(self, timeout=None):
+        packets = []
+        for key, _ in self._selector.select(timeout):
+            for data in key.fileobj.get_available_packets():
+                packets.append((key.fileobj, data))
+        return packets
+
+    def close(self):
+        self._selector.close()
+
+
 #------------------------------------------------------------------------------
 # File I/O
 #------------------------------------------------------------------------------
 
 class raw_writer:
+    # Packets below this size are coalesced in the file buffer (IMU, SI, ...),
+    # larger ones skip it and go out with a single writev
+    DIRECT_SIZE = 1 << 16
+
     def open(self, filename, mode):
-        self._data = open(filename, 'wb')
-        self._data.write(struct.pack('<B', mode))
+        self._data = open(filename, 'wb', buffering=raw_writer.DIRECT_SIZE)
+        self._data.write(_CONFIGURATION_BYTE.pack(mode))
         self._mode = mode
 
     def write(self, data):
-        self._data.write(data.pack(self._mode))
+        buffers = [memoryview(buffer).cast('B') for buffer in data.iov(self._mode)]
+        if (sum(len(buffer) for buffer in buffers) < raw_writer.DIRECT_SIZE):
+            for buffer in buffers:
+                self._data.write(buffer)
+            return
+        # Keep file order, then writev; it may stop short, so resume from the
+        # first unwritten byte until done
+        self._data.flush()
+        fd = self._data.fileno()
+        while (len(buffers) > 0):
+            written = os.writev(fd, buffers)
+            while (len(buffers) > 0 and written >= len(buffers[0])):
+                written -= len(buffers[0])
+                buffers.pop(0)
+            if (len(buffers) > 0):
+                buffers[0] = buffers[0][written:]
 
     def close(self):
         self._data.close()
 
 
 class raw_reader:
+    # The file is mapped rather than read: payloads and poses are read-only
+    # views into the mapping, paged in by the kernel on access.
     def open(self, filename, chunk_size):
         self._data = open(filename, 'rb')
-        self._mode = struct.unpack('<B', self._data.read(_SIZEOF.BYTE))[0]
-        self._unpacker = unpacker(self._mode)
+        self._map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        self._mode = self._view[0]
+        self._cursor = _SIZEOF.BYTE
         self._chunk_size = chunk_size
-        self._eof = False
         
     def read(self):
-        while (True):
-            if (self._unpacker.unpack()):
-                return self._unpacker.get()
-            elif (self._eof):
-                return None
-            else:
-                chunk = self._data.read(self._chunk_size)
-                self._eof = len(chunk) < self._chunk_size
-                self._unpacker.extend(chunk)
+        begin = self._cursor + _PACKET_HEADER.size
+        if (begin > len(self._view)):
+            return None
+        timestamp, size = _PACKET_HEADER.unpack_from(self._view, self._cursor)
+        end = begin + size
+        pose_end = end + (64 if (self._mode == StreamMode.MODE_1) else 0)
+        if (pose_end > len(self._view)):
+            return None
+        pose = np.frombuffer(self._view[end:pose_end], dtype=np.float32).reshape((4, 4)) if (self._mode == StreamMode.MODE_1) else None
+        self._cursor = pose_end
+        return packet(timestamp, self._view[begin:end], pose)
 
     def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # Packets still hold views; the mapping goes away with the last one
+            pass
         self._data.close()
 
 
@@ -351,12 +512,47 @@ class RM_Depth_Frame:
         self.ab    = ab
 
 
-def unpack_rm_depth(payload):
+def _decode_rm_depth(payload):
     composite = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
     h, w, _ = composite.shape
-    interleaved = composite.view(np.uint16).reshape((h, w, 2))
-    depth, ab = np.dsplit(interleaved, 2)
-    return RM_Depth_Frame(depth, ab)
+    return composite.view(np.uint16).reshape((h, w, 2))
+
+
+def unpack_rm_depth(payload):
+    interleaved = _decode_rm_depth(payload)
+    # Strided views into the decoded image; keep the trailing axis so
+    # depth and ab stay (h, w, 1) like the np.dsplit result they replace.
+    return RM_Depth_Frame(interleaved[:, :, 0:1], interleaved[:, :, 1:2])
+
+
+def unpack_rm_depth_batch(payloads, out_depth=None, out_ab=None, max_workers=None):
+    # Offline decode of many frames: cv2.imdecode releases the GIL, so a
+    # thread pool scales with cores. Returns (N, h, w) depth and ab arrays.
+    payloads = list(payloads)
+    if (len(payloads) == 0):
+        # No frame to take h, w from: the caller's arrays or empty ones
+        if (out_depth is None):
+            out_depth = np.empty((0, 0, 0), dtype=np.uint16)
+        if (out_ab is None):
+            out_ab = np.empty((0, 0, 0), dtype=np.uint16)
+        return out_depth, out_ab
+    first = _decode_rm_depth(payloads[0])
+    h, w, _ = first.shape
+    if (out_depth is None):
+        out_depth = np.empty((len(payloads), h, w), dtype=np.uint16)
+    if (out_ab is None):
+        out_ab = np.empty((len(payloads), h, w), dtype=np.uint16)
+
+    def store(index, interleaved):
+        out_depth[index] = interleaved[:, :, 0]
+        out_ab[index] = interleaved[:, :, 1]
+
+    store(0, first)
+    with ThreadPoolExecutor(max_workers) as pool:
+        for _ in pool.map(lambda index: store(index, _decode_rm_depth(payloads[index])), range(1, len(payloads))):
+            pass
+
+    return out_depth, out_ab
 
 
 #------------------------------------------------------------------------------
@@ -371,16 +567,24 @@ class RM_IMU_Sample:
         self.z               = z
 
 
+_RM_IMU_SAMPLE_DTYPE = np.dtype([('sensor_ticks_ns', '<u8'), ('_reserved', '<u8'), ('x', '<f4'), ('y', '<f4'), ('z', '<f4')])
+
+
 class unpack_rm_imu:
     def __init__(self, payload):
         self._count = int(len(payload) / 28)
         self._batch = payload
+        self._samples = np.frombuffer(payload, dtype=_RM_IMU_SAMPLE_DTYPE, count=self._count)
 
     def get_count(self):
         return self._count
 
+    def get_arrays(self):
+        # Zero-copy views over the whole batch: sensor_ticks_ns, x, y, z
+        return (self._samples['sensor_ticks_ns'], self._samples['x'], self._samples['y'], self._samples['z'])
+
     def get_sample(self, index):
-        data = struct.unpack('<QQfff', self._batch[(index * 28):((index + 1) * 28)])
+        data = _RM_IMU_SAMPLE.unpack_from(self._batch, index * _RM_IMU_SAMPLE.size)
         return RM_IMU_Sample(data[0], data[2], data[3], data[4])
 
 
@@ -395,6 +599,10 @@ class _SI_Field:
     RIGHT = 8
 
 
+# is_valid_* answers for every value of the SI valid byte: (head, eye, left, right)
+_SI_VALID_TABLE = tuple(((v & _SI_Field.HEAD) != 0, (v & _SI_Field.EYE) != 0, (v & _SI_Field.LEFT) != 0, (v & _SI_Field.RIGHT) != 0) for v in range(256))
+
+
 class SI_HeadPose:
     def __init__(self, position, forward, up):
         self.position = position
@@ -447,39 +655,40 @@ class _Mode0Layout_SI:
     END_HAND_RIGHT      = BEGIN_HAND_RIGHT + HandJointKind.TOTAL * _Mode0Layout_SI_Hand.BYTE_COUNT
 
 
+_SI_HAND_JOINT_DTYPE = np.dtype([('orientation', '<f4', (4,)), ('position', '<f4', (3,)), ('radius', '<f4', (1,)), ('accuracy', '<i4', (1,))])
+
+
 class unpack_si_hand:
     def __init__(self, payload):
         self._data = payload
+        self._joints = np.frombuffer(payload, dtype=_SI_HAND_JOINT_DTYPE, count=HandJointKind.TOTAL)
 
     def get_joint_pose(self, joint):
-        begin = joint * _Mode0Layout_SI_Hand.BYTE_COUNT
-        end = begin + _Mode0Layout_SI_Hand.BYTE_COUNT
-        data = self._data[begin:end]
-
-        orientation = np.frombuffer(data[_Mode0Layout_SI_Hand.BEGIN_ORIENTATION : _Mode0Layout_SI_Hand.END_ORIENTATION], dtype=np.float32)
-        position    = np.frombuffer(data[_Mode0Layout_SI_Hand.BEGIN_POSITION    : _Mode0Layout_SI_Hand.END_POSITION],    dtype=np.float32)
-        radius      = np.frombuffer(data[_Mode0Layout_SI_Hand.BEGIN_RADIUS      : _Mode0Layout_SI_Hand.END_RADIUS],      dtype=np.float32)
-        accuracy    = np.frombuffer(data[_Mode0Layout_SI_Hand.BEGIN_ACCURACY    : _Mode0Layout_SI_Hand.END_ACCURACY],    dtype=np.int32)
+        data = self._joints[joint]
+        return SI_HandJointPose(data['orientation'], data['position'], data['radius'], data['accuracy'])
 
-        return SI_HandJointPose(orientation, position, radius, accuracy)
+    def get_all(self):
+        # Zero-copy (26, n) views for every joint: orientation, position, radius, accuracy
+        return (self._joints['orientation'], self._joints['position'], self._joints['radius'], self._joints['accuracy'])
 
 
 class unpack_si:
     def __init__(self, payload):
         self._data = payload
-        self._valid = np.frombuffer(payload[_Mode0Layout_SI.BEGIN_VALID : _Mode0Layout_SI.END_VALID], dtype=np.uint8)
+        # One table lookup, the poses themselves are only parsed by their getters
+        self._valid = _SI_VALID_TABLE[payload[_Mode0Layout_SI.BEGIN_VALID]]
 
     def is_valid_head_pose(self):
-        return (self._valid & _SI_Field.HEAD) != 0
+        return self._valid[0]
 
     def is_valid_eye_ray(self):
-        return (self._valid & _SI_Field.EYE) != 0
+        return self._valid[1]
 
     def is_valid_hand_left(self):
-        return (self._valid & _SI_Field.LEFT) != 0
+        return self._valid[2]
 
     def is_valid_hand_right(self):
-        return (self._valid & _SI_Field.RIGHT) != 0
+        return self._valid[3]
 
     def get_head_pose(self):
         position = np.frombuffer(self._data[_Mode0Layout_SI.BEGIN_HEAD_POSITION : _Mode0Layout_SI.END_HEAD_POSITION], dtype=np.float32)
@@ -505,43 +714,38 @@ class unpack_si:
 # Codecs
 #------------------------------------------------------------------------------
 
+_VIDEO_CODEC_NAME = {
+    VideoProfile.H264_BASE : 'h264',
+    VideoProfile.H264_MAIN : 'h264',
+    VideoProfile.H264_HIGH : 'h264',
+    VideoProfile.H265_MAIN : 'hevc',
+}
+
+_AUDIO_CODEC_NAME = {
+    AudioProfile.AAC_12000 : 'aac',
+    AudioProfile.AAC_16000 : 'aac',
+    AudioProfile.AAC_20000 : 'aac',
+    AudioProfile.AAC_24000 : 'aac',
+}
+
+_AUDIO_CODEC_BITRATE = {
+    AudioProfile.AAC_12000 : 12000*8,
+    AudioProfile.AAC_16000 : 16000*8,
+    AudioProfile.AAC_20000 : 20000*8,
+    AudioProfile.AAC_24000 : 24000*8,
+}
+
+
 def get_video_codec_name(profile):
-    if   (profile == VideoProfile.H264_BASE):
-        return 'h264'
-    elif (profile == VideoProfile.H264_MAIN):
-        return 'h264'
-    elif (profile == VideoProfile.H264_HIGH):
-        return 'h264'
-    elif (profile == VideoProfile.H265_MAIN):
-        return 'hevc'
-    else:
-        return None
+    return _VIDEO_CODEC_NAME.get(profile)
 
 
 def get_audio_codec_name(profile):
-    if   (profile == AudioProfile.AAC_12000):
-        return 'aac'
-    elif (profile == AudioProfile.AAC_16000):
-        return 'aac'
-    elif (profile == AudioProfile.AAC_20000):
-        return 'aac'
-    elif (profile == AudioProfile.AAC_24000):
-        return 'aac'
-    else:
-        return None
+    return _AUDIO_CODEC_NAME.get(profile)
 
 
 def get_audio_codec_bitrate(profile):
-    if   (profile == AudioProfile.AAC_12000):
-        return 12000*8
-    elif (profile == AudioProfile.AAC_16000):
-        return 16000*8
-    elif (profile == AudioProfile.AAC_20000):
-        return 20000*8
-    elif (profile == AudioProfile.AAC_24000):
-        return 24000*8
-    else:
-        return None
+    return _AUDIO_CODEC_BITRATE.get(profile)
 
 
 #------------------------------------------------------------------------------
@@ -549,15 +753,19 @@ def get_audio_codec_bitrate(profile):
 #------------------------------------------------------------------------------
 
 def _create_configuration_for_mode(mode):
-    return struct.pack('<B', mode)
+    return _CONFIGURATION_BYTE.pack(mode)
 
 
 def _create_configuration_for_video(mode, width, height, framerate, profile, bitrate):
-    return struct.pack('<BHHBBI', mode, width, height, framerate, profile, bitrate)
+    return _CONFIGURATION_VIDEO.pack(mode, width, height, framerate, profile, bitrate)
 
 
 def _create_configuration_for_audio(profile):
-    return struct.pack('<B', profile)
+    return _CONFIGURATION_BYTE.pack(profile)
+
+
+# Calibration requests for the RM streams never vary, build the bytes once
+_CONFIGURATION_MODE_2 = _create_configuration_for_mode(StreamMode.MODE_2)
 
 
 #------------------------------------------------------------------------------
@@ -678,6 +886,13 @@ class Mode2_PV:
         self.projection            = projection
 
 
+def _interleave_uv2xy(uv2x, uv2y):
+    uv2xy = np.empty(uv2x.shape + (2,), dtype=uv2x.dtype)
+    uv2xy[:, :, 0] = uv2x
+    uv2xy[:, :, 1] = uv2y
+    return uv2xy
+
+
 def _download_mode2_data(host, port, configuration, bytes):
     c = client()
 
@@ -690,18 +905,18 @@ def _download_mode2_data(host, port, configuration, bytes):
 
 
 def download_calibration_rm_vlc(host, port):
-    data   = _download_mode2_data(host, port, _create_configuration_for_mode(StreamMode.MODE_2), _Mode2Layout_RM_VLC.FLOAT_COUNT * _SIZEOF.FLOAT)
+    data   = _download_mode2_data(host, port, _CONFIGURATION_MODE_2, _Mode2Layout_RM_VLC.FLOAT_COUNT * _SIZEOF.FLOAT)
     floats = np.frombuffer(data, dtype=np.float32)
 
     uv2x       = floats[_Mode2Layout_RM_VLC.BEGIN_UV2X       : _Mode2Layout_RM_VLC.END_UV2X].reshape(Parameters_RM_VLC.SHAPE)
     uv2y       = floats[_Mode2Layout_RM_VLC.BEGIN_UV2Y       : _Mode2Layout_RM_VLC.END_UV2Y].reshape(Parameters_RM_VLC.SHAPE)
     extrinsics = floats[_Mode2Layout_RM_VLC.BEGIN_EXTRINSICS : _Mode2Layout_RM_VLC.END_EXTRINSICS].reshape((4, 4))
 
-    return Mode2_RM_VLC(np.dstack((uv2x, uv2y)), extrinsics)
+    return Mode2_RM_VLC(_interleave_uv2xy(uv2x, uv2y), extrinsics)
 
 
 def download_calibration_rm_depth(host, port):
-    data   = _download_mode2_data(host, port, _create_configuration_for_mode(StreamMode.MODE_2), _Mode2Layout_RM_DEPTH_LONGTHROW.FLOAT_COUNT * _SIZEOF.FLOAT)
+    data   = _download_mode2_data(host, port, _CONFIGURATION_MODE_2, _Mode2Layout_RM_DEPTH_LONGTHROW.FLOAT_COUNT * _SIZEOF.FLOAT)
     floats = np.frombuffer(data, dtype=np.float32)
 
     uv2x       = floats[_Mode2Layout_RM_DEPTH_LONGTHROW.BEGIN_UV2X       : _Mode2Layout_RM_DEPTH_LONGTHROW.END_UV2X].reshape(Parameters_RM_DEPTH_LONGTHROW.SHAPE)
@@ -709,11 +924,11 @@ def download_calibration_rm_depth(host, port):
     extrinsics = floats[_Mode2Layout_RM_DEPTH_LONGTHROW.BEGIN_EXTRINSICS : _Mode2Layout_RM_DEPTH_LONGTHROW.END_EXTRINSICS].reshape((4, 4))
     scale      = floats[_Mode2Layout_RM_DEPTH_LONGTHROW.BEGIN_SCALE      : _Mode2Layout_RM_DEPTH_LONGTHROW.END_SCALE]
 
-    return Mode2_RM_DEPTH(np.dstack((uv2x, uv2y)), extrinsics, scale)
+    return Mode2_RM_DEPTH(_interleave_uv2xy(uv2x, uv2y), extrinsics, scale)
 
 
 def download_calibration_rm_imu(host, port):
-    data   = _download_mode2_data(host, port, _create_configuration_for_mode(StreamMode.MODE_2), _Mode2Layout_RM_IMU.FLOAT_COUNT * _SIZEOF.FLOAT)
+    data   = _download_mode2_data(host, port, _CONFIGURATION_MODE_2, _Mode2Layout_RM_IMU.FLOAT_COUNT * _SIZEOF.FLOAT)
     floats = np.frombuffer(data, dtype=np.float32)
 
     extrinsics = floats[_Mode2Layout_RM_IMU.BEGIN_EXTRINSICS : _Mode2Layout_RM_IMU.END_EXTRINSICS].reshape((4, 4))
@@ -745,8 +960,16 @@ def download_calibration_pv(host, port, width, height, framerate, profile, bitra
 # Receiver Wrappers
 #------------------------------------------------------------------------------
 
+def _create_video_decoder(profile, hwaccel):
+    # hwaccel is an FFmpeg device type (e.g. 'cuda', 'vaapi', 'd3d11va'); frames
+    # are decoded on the device and downloaded for the format conversion
+    if (hwaccel is None):
+        return av.CodecContext.create(get_video_codec_name(profile), 'r')
+    return av.CodecContext.create(get_video_codec_name(profile), 'r', hwaccel=av.codec.hwaccel.HWAccel(hwaccel))
+
+
 class rx_rm_vlc:
-    def __init__(self, host, port, chunk, mode, profile, bitrate, format):
+    def __init__(self, host, port, chunk, mode, profile, bitrate, format, hwaccel=None):
         self.host = host
         self.port = port
         self.chunk = chunk
@@ -754,18 +977,20 @@ class rx_rm_vlc:
         self.profile = profile
         self.bitrate = bitrate
         self.format = format
+        self.hwaccel = hwaccel
 
     def open(self):
-        self._codec = av.CodecContext.create(get_video_codec_name(self.profile), 'r')
+        self._codec = _create_video_decoder(self.profile, self.hwaccel)
         self._client = connect_client_rm_vlc(self.host, self.port, self.chunk, self.mode, self.profile, self.bitrate)
-        self.get_next_packet()
 
     def get_next_packet(self):
-        data = self._client.get_next_packet()
-        for packet in self._codec.parse(data.payload):
-            for frame in self._codec.decode(packet):
+        # Each HL2SS payload is one complete access unit, no need to run the parser.
+        # Packets that do not complete a frame yet (decoder warm-up) are skipped.
+        while True:
+            data = self._client.get_next_packet()
+            for frame in self._codec.decode(av.Packet(data.payload)):
                 data.payload = frame.to_ndarray(format=self.format)
-        return data
+                return data
 
     def close(self):
         self._client.close()
@@ -808,7 +1033,7 @@ class rx_rm_imu:
 
 
 class rx_pv:
-    def __init__(self, host, port, chunk, mode, width, height, framerate, profile, bitrate, format):
+    def __init__(self, host, port, chunk, mode, width, height, framerate, profile, bitrate, format, hwaccel=None):
         self.host = host
         self.port = port
         self.chunk = chunk
@@ -819,18 +1044,20 @@ class rx_pv:
         self.profile = profile
         self.bitrate = bitrate
         self.format = format
+        self.hwaccel = hwaccel
 
     def open(self):
-        self._codec = av.CodecContext.create(get_video_codec_name(self.profile), 'r')
+        self._codec = _create_video_decoder(self.profile, self.hwaccel)
         self._client = connect_client_pv(self.host, self.port, self.chunk, self.mode, self.width, self.height, self.framerate, self.profile, self.bitrate)
-        self.get_next_packet()
 
     def get_next_packet(self):
-        data = self._client.get_next_packet()
-        for packet in self._codec.parse(data.payload):
-            for frame in self._codec.decode(packet):
+        # Each HL2SS payload is one complete access unit, no need to run the parser.
+        # Packets that do not complete a frame yet (decoder warm-up) are skipped.
+        while True:
+            data = self._client.get_next_packet()
+            for frame in self._codec.decode(av.Packet(data.payload)):
                 data.payload = frame.to_ndarray(format=self.format)
-        return data
+                return data
 
     def close(self):
         self._client.close()
@@ -843,7 +1070,8 @@ class rx_mc:
         self.chunk = chunk
         self.profile = profile
         # ======================
-        self.resampler = av.audio.resampler.AudioResampler(format='s16', layout='stereo', rate=48000)
+        # Planar output: to_ndarray() already yields one row per channel
+        self.resampler = av.audio.resampler.AudioResampler(format='s16p', layout='stereo', rate=48000)
 
     def open(self):
         self._codec = av.CodecContext.create(get_audio_codec_name(self.profile), 'r')
@@ -856,11 +1084,7 @@ class rx_mc:
                 # data.payload = frame.to_ndarray()
                 # ================================================
                 for audio in self.resampler.resample(frame):
-                    audio_arr = audio.to_ndarray()
-                    data.payload=audio_arr
-                    # print(audio_arr.shape)
-                    data.payload = np.concatenate((audio_arr[0:1,0::2],audio_arr[0:1,1::2]))
-                    # print()
+                    data.payload = audio.to_ndarray()
                 # =================================================
         return data
 
@@ -884,23 +1108,125 @@ class rx_si:
         self._client.close()
 
 
+def _pin_thread(cpus):
+    # On Linux pid 0 means the calling thread, so this pins just the worker
+    if (cpus is not None and hasattr(os, 'sched_setaffinity')):
+        os.sched_setaffinity(0, cpus)
+
+
+class rx_async:
+    # Runs another receiver's get_next_packet (recv + decode) on a background
+    # thread so it overlaps with the consumer; the bounded queue applies
+    # backpressure when the consumer falls behind. cpus optionally pins the
+    # worker to a set of cores
+    def __init__(self, rx, queue_size=8, cpus=None):
+        self.rx = rx
+        self.queue_size = queue_size
+        self.cpus = cpus
+
+    def _run(self):
+        _pin_thread(self.cpus)
+        try:
+            while (self._running):
+                self._queue.put(self.rx.get_next_packet())
+        except Exception as e:
+            self._queue.put(e)
+
+    def open(self):
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._running = True
+        self.rx.open()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def get_next_packet(self):
+        data = self._queue.get()
+        if (isinstance(data, Exception)):
+            raise data
+        return data
+
+    def close(self):
+        self._running = False
+        self.rx.close()
+        while (self._thread.is_alive()):
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+
+
 #------------------------------------------------------------------------------
 # Writers
 #------------------------------------------------------------------------------
 
 class _wr_ancillary:
+    # Records are written straight into a preallocated, memory-mapped file
+    # (no syscall per frame); the file grows by GROW_SIZE when full and is
+    # truncated to the records actually written on close
+    GROW_SIZE = 1 << 24
+
     def __init__(self, filename, mode):
-        self._file = open(filename, 'wb')
-        self._file.write(struct.pack('<B', mode))
+        self._fd = os.open(filename, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
         self._mode = mode
-        
+        self._dtype = _ANCILLARY_MODE_1 if (mode == StreamMode.MODE_1) else _ANCILLARY_MODE_0
+        self._count = 0
+        self._map = None
+        self._grow()
+        self._map[0] = mode
+
+    def _grow(self):
+        size = (len(self._map) if (self._map is not None) else 0) + _wr_ancillary.GROW_SIZE
+        self._unmap()
+        if (hasattr(os, 'posix_fallocate')):
+            os.posix_fallocate(self._fd, 0, size)
+        else:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        records = np.frombuffer(self._map, dtype=self._dtype, count=(size - _SIZEOF.BYTE) // self._dtype.itemsize, offset=_SIZEOF.BYTE)
+        self._timestamps = records['timestamp']
+        self._poses = records['pose'] if (self._mode == StreamMode.MODE_1) else None
+
+    def _unmap(self):
+        if (self._map is not None):
+            self._timestamps = None
+            self._poses = None
+            self._map.close()
+
     def write(self, data):
-        self._file.write(struct.pack('<Q', data.timestamp))
-        if (self._mode == StreamMode.MODE_1):
-            self._file.write(data.pose.tobytes())
+        if (self._count >= len(self._timestamps)):
+            self._grow()
+        self._timestamps[self._count] = data.timestamp
+        if (self._poses is not None):
+            self._poses[self._count] = data.pose
+        self._count += 1
 
     def close(self):
-        self._file.close()
+        self._unmap()
+        os.ftruncate(self._fd, _SIZEOF.BYTE + self._count * self._dtype.itemsize)
+        os.close(self._fd)
+
+
+def _create_video_frame(width, height, format):
+    # Reusable input frame for the video writers, only for packed formats
+    frame = av.VideoFrame(width, height, format)
+    return frame if (len(frame.planes) == 1) else None
+
+
+def _fill_video_frame(frame, payload):
+    # Copy a packed uint8 image into the reusable frame's plane, row by row to
+    # honour its line padding; None if the payload doesn't fit that layout
+    if (frame is None or payload.dtype != np.uint8 or payload.shape[:2] != (frame.height, frame.width)):
+        return None
+    frame.make_writable()
+    plane = frame.planes[0]
+    row = payload[0].nbytes
+    if (row > plane.line_size):
+        return None
+    np.frombuffer(plane, np.uint8, count=frame.height * plane.line_size).reshape((frame.height, plane.line_size))[:, :row] = payload.reshape((frame.height, row))
+    # Let the encoder number it like a fresh frame
+    frame.pts = None
+    return frame
 
 
 class wr_rm_vlc:
@@ -914,7 +1240,7 @@ class wr_rm_vlc:
 
     def _encode(self, frame):
         for packet in self._stream.encode(frame):
-            self._frames.mux(packet)
+            self._frames.mux_one(packet)
 
     def open(self):
         self._ancillary = _wr_ancillary(os.path.join(self.path, 'rm_vlc_' + self.name + '_ancillary.bin'), self.mode)
@@ -924,10 +1250,16 @@ class wr_rm_vlc:
         self._stream.height = Parameters_RM_VLC.HEIGHT
         self._stream.pix_fmt = Parameters_RM_VLC.FORMAT
         self._stream.bit_rate = self.bitrate
+        self._frame = _create_video_frame(Parameters_RM_VLC.WIDTH, Parameters_RM_VLC.HEIGHT, self.format)
+        # Let the encoder use every core (0 = auto), frame threading suits file output
+        self._stream.thread_count = 0
+        self._stream.thread_type = 'FRAME'
 
     def write(self, data):
         self._ancillary.write(data)
-        frame = av.VideoFrame.from_ndarray(data.payload, format=self.format)
+        frame = _fill_video_frame(self._frame, data.payload)
+        if (frame is None):
+            frame = av.VideoFrame.from_ndarray(data.payload, format=self.format)
         self._encode(frame)
 
     def close(self):
@@ -936,27 +1268,83 @@ class wr_rm_vlc:
         self._ancillary.close()
 
 
+class _tar_writer:
+    # Minimal ustar writer for the depth archives: regular files with short
+    # names only, so every entry is a template header plus name, size and
+    # checksum, followed by the data and zero padding to 512 bytes
+    BLOCK_SIZE = 512
+    RECORD_SIZE = 20 * BLOCK_SIZE
+
+    def __init__(self, filename):
+        self._file = open(filename, 'wb', buffering=1 << 20)
+        self._offset = 0
+        self._template = bytearray(_tar_writer.BLOCK_SIZE)
+        self._template[100:108] = b'0000644\0'
+        self._template[108:116] = b'0000000\0'
+        self._template[116:124] = b'0000000\0'
+        self._template[136:148] = b'00000000000\0'
+        self._template[156:157] = b'0'
+        self._template[257:265] = b'ustar\x0000'
+
+    def add(self, name, buffer):
+        size = len(buffer)
+        header = bytearray(self._template)
+        header[0:100] = name.encode('utf-8').ljust(100, b'\0')
+        header[124:136] = b'%011o\0' % size
+        header[148:156] = b' ' * 8
+        header[148:156] = b'%06o\0 ' % sum(header)
+        padding = -size % _tar_writer.BLOCK_SIZE
+        self._file.write(header)
+        self._file.write(buffer)
+        self._file.write(bytes(padding))
+        self._offset += _tar_writer.BLOCK_SIZE + size + padding
+
+    def close(self):
+        # End of archive is two zero blocks, padded to a whole record like tarfile
+        end = self._offset + 2 * _tar_writer.BLOCK_SIZE
+        self._file.write(bytes(end - self._offset + (-end % _tar_writer.RECORD_SIZE)))
+        self._file.close()
+
+
 class wr_rm_depth:
+    # Frames whose PNGs may still be encoding before write() waits
+    MAX_PENDING = 8
+
     def __init__(self, path, name, mode):
         self.path = path
         self.name = name
         self.mode = mode
 
     def _add_buffer(self, name, buffer):
-        file = tarfile.TarInfo(name)
-        file.size = len(buffer)
-        self._frames.addfile(file, io.BytesIO(initial_bytes=buffer))
+        self._frames.add(name, buffer)
+
+    def _add_pending(self):
+        # Tar entries are added in frame order by this thread only
+        id, depth, ab = self._pending.popleft()
+        self._add_buffer('depth_{v}.png'.format(v=id), depth.result()[1])
+        self._add_buffer('ab_{v}.png'.format(v=id), ab.result()[1])
+
+    def _flush(self, limit):
+        # Wait only on the oldest frames beyond limit, then take any others already encoded
+        while (len(self._pending) > limit):
+            self._add_pending()
+        while (len(self._pending) > 0 and self._pending[0][1].done() and self._pending[0][2].done()):
+            self._add_pending()
 
     def _encode(self, payload):
-        depth = cv2.imencode('.png', payload.depth)[1]
-        ab = cv2.imencode('.png', payload.ab)[1]
-        self._add_buffer('depth_{v}.png'.format(v=self._id), depth)
-        self._add_buffer('ab_{v}.png'.format(v=self._id), ab)
+        # PNG compression runs on the pool (cv2 releases the GIL), both
+        # planes and several frames at once
+        depth = self._pool.submit(cv2.imencode, '.png', payload.depth)
+        ab = self._pool.submit(cv2.imencode, '.png', payload.ab)
+        self._pending.append((self._id, depth, ab))
         self._id += 1
+        self._flush(wr_rm_depth.MAX_PENDING)
 
     def open(self):
         self._ancillary = _wr_ancillary(os.path.join(self.path, 'rm_depth_' + self.name + '_ancillary.bin'), self.mode)
-        self._frames = tarfile.open(os.path.join(self.path, 'rm_depth_' + self.name + '.tar'), 'w')
+        self._frames = _tar_writer(os.path.join(self.path, 'rm_depth_' + self.name + '.tar'))
+        self._pool = ThreadPoolExecutor(max_workers=4)
+        self._pending = collections.deque()
         self._id = 0
         
     def write(self, data):
@@ -964,6 +1352,8 @@ class wr_rm_depth:
         self._encode(data.payload)
        
     def close(self):
+        self._flush(0)
+        self._pool.shutdown()
         self._frames.close()
         self._ancillary.close()
 
@@ -998,7 +1388,7 @@ class wr_pv:
 
     def _encode(self, frame):
         for packet in self._stream.encode(frame):
-            self._frames.mux(packet)
+            self._frames.mux_one(packet)
 
     def open(self):        
         self._ancillary = _wr_ancillary(os.path.join(self.path, 'pv_ancillary.bin'), self.mode)
@@ -1008,10 +1398,16 @@ class wr_pv:
         self._stream.height = self.height
         self._stream.pix_fmt = Parameters_PV.FORMAT
         self._stream.bit_rate = self.bitrate
+        self._frame = _create_video_frame(self.width, self.height, self.format)
+        # Let the encoder use every core (0 = auto), frame threading suits file output
+        self._stream.thread_count = 0
+        self._stream.thread_type = 'FRAME'
 
     def write(self, data):
         self._ancillary.write(data)
-        frame = av.VideoFrame.from_ndarray(data.payload, format=self.format)
+        frame = _fill_video_frame(self._frame, data.payload)
+        if (frame is None):
+            frame = av.VideoFrame.from_ndarray(data.payload, format=self.format)
         self._encode(frame)
 
     def close(self):
@@ -1032,7 +1428,7 @@ class wr_mc:
             packet.pts = self._id
             packet.dts = self._id
             packet.time_base = Fraction(Parameters_MC.GROUP_SIZE, Parameters_MC.SAMPLE_RATE)
-            self._frames.mux(packet)
+            self._frames.mux_one(packet)
             self._id += 1
 
     def open(self):        
@@ -1068,48 +1464,87 @@ class wr_si:
         self._writer.close()
 
 
+class wr_async:
+    # Runs another writer's write (encode + mux) on a background thread so the
+    # acquisition loop only pays for an enqueue; the bounded queue applies
+    # backpressure. Packets are queued by reference, so payloads must not be
+    # reused by the caller after write. cpus optionally pins the worker to a
+    # set of cores
+    def __init__(self, wr, queue_size=8, cpus=None):
+        self.wr = wr
+        self.queue_size = queue_size
+        self.cpus = cpus
+
+    def _run(self):
+        _pin_thread(self.cpus)
+        while (True):
+            data = self._queue.get()
+            if (data is None):
+                break
+            if (self._error is None):
+                try:
+                    self.wr.write(data)
+                except Exception as e:
+                    # Keep draining so write() never blocks on a dead worker
+                    self._error = e
+
+    def open(self):
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._error = None
+        self.wr.open()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        if (self._error is not None):
+            raise self._error
+        self._queue.put(data)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self.wr.close()
+        if (self._error is not None):
+            raise self._error
+
+
 #------------------------------------------------------------------------------
 # Readers
 #------------------------------------------------------------------------------
 
+_ANCILLARY_MODE_0 = np.dtype([('timestamp', '<u8')])
+_ANCILLARY_MODE_1 = np.dtype([('timestamp', '<u8'), ('pose', '<f4', (4, 4))])
+
+
 class _rd_ancillary:
+    # Records are fixed size, so the file is mapped once and viewed as a
+    # record array; assemble only indexes it
     def __init__(self, filename):
         self._file = open(filename, 'rb')
-        self._mode = struct.unpack('<B', self._file.read(_SIZEOF.BYTE))[0]
-
-    def read_field(self, size):
-        data = self._file.read(size)
-        if (len(data) != size):
-            return None
-        return data
-
-    def read_timestamp(self):
-        timestamp = self.read_field(_SIZEOF.LONGLONG)
-        if (timestamp is None):
-            return None
-        return struct.unpack('<Q', timestamp)[0]
-
-    def read_pose(self):
-        pose = self.read_field(_SIZEOF.FLOAT * 16)
-        if (pose is None):
-            return None
-        return np.frombuffer(pose, dtype=np.float32).reshape((4, 4))
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mode = self._map[0]
+        dtype = _ANCILLARY_MODE_1 if (self._mode == StreamMode.MODE_1) else _ANCILLARY_MODE_0
+        records = np.frombuffer(self._map, dtype=dtype, count=(len(self._map) - _SIZEOF.BYTE) // dtype.itemsize, offset=_SIZEOF.BYTE)
+        self._timestamps = records['timestamp']
+        self._poses = records['pose'] if (self._mode == StreamMode.MODE_1) else None
+        self._index = 0
 
     def assemble(self, payload):
-        if (payload is None):
+        if (payload is None or self._index >= len(self._timestamps)):
             return None
-        timestamp = self.read_timestamp()
-        if (timestamp is None):
-            return None
-        if (self._mode == StreamMode.MODE_1):
-            pose = self.read_pose()
-            if (pose is None):
-                return None
-        else:
-            pose = None
+        timestamp = self._timestamps[self._index].item()
+        pose = self._poses[self._index] if (self._poses is not None) else None
+        self._index += 1
         return packet(timestamp, payload, pose)
 
     def close(self):
+        self._timestamps = None
+        self._poses = None
+        try:
+            self._map.close()
+        except BufferError:
+            # Poses handed out still view the mapping; it goes away with them
+            pass
         self._file.close()
 
 
@@ -1122,12 +1557,15 @@ class rd_rm_vlc:
     def _decode(self):
         payload = next(self._generator, None)
         if (payload is not None):
-            payload = payload.to_ndarray(format=self.format)
+            # Reusing one reformatter keeps its scaler context across frames
+            payload = self._reformatter.reformat(payload, format=self.format).to_ndarray()
         return payload
 
     def open(self):
         self._ancillary = _rd_ancillary(os.path.join(self.path, 'rm_vlc_' + self.name + '_ancillary.bin'))
         self._frames = av.open(os.path.join(self.path, 'rm_vlc_' + self.name + '.mp4'), mode='r')
+        self._frames.streams.video[0].thread_type = 'AUTO'
+        self._reformatter = av.video.reformatter.VideoReformatter()
         self._generator = (frame for frame in self._frames.decode(video=0))
         
     def read(self):
@@ -1194,12 +1632,15 @@ class rd_pv:
     def _decode(self):
         payload = next(self._generator, None)
         if (payload is not None):
-            payload = payload.to_ndarray(format=self.format)
+            # Reusing one reformatter keeps its scaler context across frames
+            payload = self._reformatter.reformat(payload, format=self.format).to_ndarray()
         return payload
 
     def open(self):
         self._ancillary = _rd_ancillary(os.path.join(self.path, 'pv_ancillary.bin'))        
         self._frames = av.open(os.path.join(self.path, 'pv.mp4'), mode='r')
+        self._frames.streams.video[0].thread_type = 'AUTO'
+        self._reformatter = av.video.reformatter.VideoReformatter()
         self._generator = (frame for frame in self._frames.decode(video=0))        
 
     def read(self):
@@ -3,11 +3,15 @@ from posix_ipc import (
     O_CREX,
     unlink_shared_memory,
     ExistentialError,
+    BusyError,
     O_CREAT,
     SharedMemory,
+    SEMAPHORE_TIMEOUT_SUPPORTED,
 )
+from contextlib import contextmanager
 import mmap
 import numpy as np
+import struct
 import time
 import threading
 import json
@@ -16,13 +20,17 @@ import platform
 
 system = platform.system()
 
+# Reader count and timestamp segments
+_COUNT = struct.Struct("<i")
+_STAMP = struct.Struct("<Q")
+# Metadata segment: magic, layout version, numpy dtype char, ndim, up to 8 dims.
+# Bump FORMAT_VERSION whenever any segment layout changes (see README).
+_META = struct.Struct("<4sBcB8i")
+MAGIC = b"STMF"
+FORMAT_VERSION = 2
 
-def numbers_sum(tot, n):
-    if tot <= 0 or n <= 0:
-        return []
-    number = tot // n
-    remainder = tot % n
-    return [number + 1] * remainder + [number] * (n - remainder)
+# Mappings at least this large get transparent huge page advice
+HUGE_PAGE_SIZE = 2 << 20
 
 
 if system == "Darwin":
@@ -79,53 +87,144 @@ if system == "Darwin":
             self.socket.close()
 
 else:
-    from posix_ipc import MessageQueue, unlink_message_queue
+    from posix_ipc import unlink_semaphore
+
+    # Control messages go through a ring of fixed slots in shared memory:
+    # [head:u32][tail:u32][slot: (op:u8, size:u8, data:62s)] * CONTROL_SLOTS.
+    # Readers produce (serialized by the lock semaphore), the writer's dsync
+    # thread is the only consumer; free/used count empty and filled slots.
+    # signin/signout with a string r_id travel as an opcode plus the raw id,
+    # anything else falls back to JSON in the slot.
+    CONTROL_SLOTS = 32
+    _CONTROL_INDEX = struct.Struct("<I")
+    _CONTROL_SLOT = struct.Struct("<BB62s")
+    _CONTROL_HEAD = 0
+    _CONTROL_TAIL = _CONTROL_INDEX.size
+    _CONTROL_BEGIN = 2 * _CONTROL_INDEX.size
+    _CONTROL_JSON = 0
+    _CONTROL_OPS = {"signin": 1, "signout": 2}
+    _CONTROL_COMMANDS = {op: command for command, op in _CONTROL_OPS.items()}
 
     class CommMech:
         def __init__(self, name, mode="w"):
-            self.q_name = f"/{name}"
+            self.m_name = f"ctl-{name}"
+            self.sem_names = [f"ctl-{res}-sem-{name}" for res in ("lock", "free", "used")]
             self.mode = mode
             if mode == "w":
                 try:
-                    unlink_message_queue(self.q_name)
-                except:
+                    unlink_shared_memory(self.m_name)
+                except ExistentialError:
                     pass
-                self.mq = MessageQueue(self.q_name, max_messages=1, flags=O_CREAT)
+                ref = SharedMemory(
+                    self.m_name,
+                    O_CREX,
+                    size=_CONTROL_BEGIN + CONTROL_SLOTS * _CONTROL_SLOT.size,
+                )
+                sems = []
+                for sem_name, value in zip(self.sem_names, (1, CONTROL_SLOTS, 0)):
+                    try:
+                        unlink_semaphore(sem_name)
+                    except ExistentialError:
+                        pass
+                    sems.append(Semaphore(sem_name, O_CREX, initial_value=value))
             if mode == "r":
-                self.mq = MessageQueue(self.q_name)
+                while True:
+                    try:
+                        ref = SharedMemory(self.m_name)
+                        sems = [Semaphore(sem_name) for sem_name in self.sem_names]
+                        break
+                    except ExistentialError:
+                        print(f"Waiting for [{self.m_name}] is available.")
+                        time.sleep(0.4)
+            self.buf = memoryview(mmap.mmap(ref.fd, ref.size))
+            ref.close_fd()
+            self.lock, self.free, self.used = sems
 
         def recv(self):
-            data = json.loads(self.mq.receive()[0])
-            return data
+            self.used.acquire()
+            head = _CONTROL_INDEX.unpack_from(self.buf, _CONTROL_HEAD)[0]
+            op, size, data = _CONTROL_SLOT.unpack_from(
+                self.buf, _CONTROL_BEGIN + head * _CONTROL_SLOT.size
+            )
+            _CONTROL_INDEX.pack_into(self.buf, _CONTROL_HEAD, (head + 1) % CONTROL_SLOTS)
+            self.free.release()
+            if op == _CONTROL_JSON:
+                return json.loads(data[:size])
+            return {"r_id": data[:size].decode(), "command": _CONTROL_COMMANDS[op]}
 
         def send(self, msg):
-            self.mq.send(json.dumps(msg))
+            op = _CONTROL_OPS.get(msg.get("command"))
+            if op is not None and isinstance(msg.get("r_id"), str) and len(msg) == 2:
+                data = msg["r_id"].encode()
+            else:
+                op, data = _CONTROL_JSON, json.dumps(msg).encode()
+            if len(data) > _CONTROL_SLOT.size - 2:
+                raise ValueError(f"Control message too long: {msg}")
+            self.free.acquire()
+            self.lock.acquire()
+            tail = _CONTROL_INDEX.unpack_from(self.buf, _CONTROL_TAIL)[0]
+            _CONTROL_SLOT.pack_into(
+                self.buf, _CONTROL_BEGIN + tail * _CONTROL_SLOT.size, op, len(data), data
+            )
+            _CONTROL_INDEX.pack_into(self.buf, _CONTROL_TAIL, (tail + 1) % CONTROL_SLOTS)
+            self.lock.release()
+            self.used.release()
 
         def __del__(self):
             if self.mode == "w":
-                self.mq.unlink()
+                try:
+                    unlink_shared_memory(self.m_name)
+                    for sem_name in self.sem_names:
+                        unlink_semaphore(sem_name)
+                except ExistentialError:
+                    pass
 
 
 class SharedFrame:
+    # ram holds SLOTS frames. The writer fills a slot that is neither current
+    # nor pinned by a reader, then publishes it as current; readers pin the
+    # current slot while they copy, so neither side waits on the other's memcpy.
+    # cnt is [current:i32][pins:i32 * SLOTS] guarded by cnt_sem, stm has one
+    # timestamp per slot.
+    SLOTS = 3
+
     def __init__(self, name, shape=None, mode="r", dtype="uint8"):
         self.name = name
         self.mode = mode
         self.sems = {}
         self.sems_lock = threading.Lock()  # Add lock for thread-safe access to sems
+        self._out = None
         self.somthing = []
         self.meta = ["ram", "stm", "cnt", "mat"]
+        # Segments with a semaphore; ram slots and their stm stamps are
+        # protected by the pins in cnt
+        self.guarded = ["cnt", "mat"]
         for res in self.meta:
             setattr(self, f"{res}_name", f"{res}-{name}")
+        for res in self.guarded:
             setattr(self, f"{res}_sem_name", f"{res}-sem-{name}")
         if self.mode == "w":
             self.dtype = dtype
-            self.ram = self._crea_mem(
-                self.ram_name, int(np.prod(shape) * getattr(np, dtype)().nbytes)
-            )
-            self.stm = self._crea_mem(self.stm_name, np.int64().nbytes)
-            self.cnt = self._crea_mem(self.cnt_name, np.int32().nbytes)
+            nbytes = int(np.prod(shape) * getattr(np, dtype)().nbytes)
+            self.ram = self._crea_mem(self.ram_name, SharedFrame.SLOTS * nbytes)
+            self.stm = self._crea_mem(self.stm_name, SharedFrame.SLOTS * _STAMP.size)
+            self.cnt = self._crea_mem(self.cnt_name, (1 + SharedFrame.SLOTS) * _COUNT.size)
+            # Everything write() needs per slot is resolved here once: a typed
+            # frame view for arrays matching shape/dtype, a uint8 view for any
+            # other buffer, and the slot's timestamp offset. Both stores go
+            # through np.copyto, which drops the GIL.
+            self._frame = (tuple(shape), np.dtype(dtype))
+            self._slots = [
+                (
+                    i,
+                    np.ndarray(shape=self._frame[0], dtype=self._frame[1], buffer=self.ram, offset=i * nbytes),
+                    np.frombuffer(self.ram, np.uint8, count=nbytes, offset=i * nbytes),
+                    i * _STAMP.size,
+                )
+                for i in range(SharedFrame.SLOTS)
+            ]
             self.mat = self._crea_mem(self.mat_name, 40)
-            for res in self.meta:
+            for res in self.guarded:
                 setattr(
                     self, f"{res}_sem", self._crea_sem(getattr(self, f"{res}_sem_name"))
                 )
@@ -139,31 +238,53 @@ class SharedFrame:
         if self.mode == "r":
             for res in self.meta:
                 setattr(self, f"{res}", self._crex_mem(getattr(self, f"{res}_name")))
+            for res in self.guarded:
                 setattr(
                     self, f"{res}_sem", self._crex_sem(getattr(self, f"{res}_sem_name"))
                 )
             self.shape, self.dtype = self._deserialize()
+            # Built once per slot: read copies out of these views instead of a fresh header per frame.
+            # Sizes come from the metadata, not the segments: macOS rounds shm up to whole pages.
+            nbytes = int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+            self._ram_views = [
+                (
+                    np.ndarray(shape=self.shape, dtype=self.dtype, buffer=self.ram, offset=i * nbytes),
+                    i * _STAMP.size,
+                )
+                for i in range(SharedFrame.SLOTS)
+            ]
             self.comm = CommMech(self.name, mode="r")
             print(f"Get {self.ram_name} {self.shape}")
 
+    def __reduce__(self):
+        # Send only the name; the receiving process attaches to the same segments as a reader
+        return (SharedFrame, (self.name,))
+
     def _serialize(self, shape, dtype):
         self.mat_sem.acquire()
-        size = self.mat.shape[0]
-        fill_up_size = numbers_sum(size, 2)
-        self.mat[:] = bytes(
-            f"{'x'.join(map(str, shape)).ljust(fill_up_size[0],'*')}|{dtype.ljust(fill_up_size[-1]-1,'*')}",
-            "utf-8",
+        dims = list(shape) + [0] * (8 - len(shape))
+        _META.pack_into(
+            self.mat, 0, MAGIC, FORMAT_VERSION, np.dtype(dtype).char.encode(), len(shape), *dims
         )
         self.mat_sem.release()
 
     def _deserialize(self):
-        self.mat_sem.acquire()
-        self.shape, self.dtype = (
-            self.mat.tobytes().decode("utf-8").replace("*", "").split("|")
-        )
-        self.shape = list(map(int, self.shape.split("x")))
-        self.dtype = getattr(np, self.dtype)
-        self.mat_sem.release()
+        while True:
+            self.mat_sem.acquire()
+            magic, version, char, ndim, *dims = _META.unpack_from(self.mat)
+            self.mat_sem.release()
+            # All zeros: the writer created the segment but hasn't filled it yet
+            if magic != bytes(len(MAGIC)):
+                break
+            print(f"Waiting for [{self.mat_name}] is available.")
+            time.sleep(0.1)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(
+                f"{self.mat_name}: unsupported shared memory format "
+                f"(magic {magic!r}, version {version}; expected {MAGIC!r}, version {FORMAT_VERSION})"
+            )
+        self.shape = dims[:ndim]
+        self.dtype = np.dtype(char.decode()).type
         return self.shape, self.dtype
 
     def dsync(self):
@@ -223,9 +344,7 @@ class SharedFrame:
             # ref = SharedMemory(name, O_CREAT, size=nbytes)
             # ref.unlink()
             ref = SharedMemory(name, O_CREX, size=nbytes)
-        buf = memoryview(mmap.mmap(ref.fd, ref.size))
-        ref.close_fd()
-        return buf
+        return self._map(ref)
 
     def _crex_mem(self, name):
         ref = None
@@ -235,44 +354,153 @@ class SharedFrame:
             except ExistentialError:
                 print(f"Waiting for [{name}] is available.")
                 time.sleep(1)
-        buf = memoryview(mmap.mmap(ref.fd, ref.size))
+        return self._map(ref)
+
+    def _map(self, ref):
+        mapped = mmap.mmap(ref.fd, ref.size)
         ref.close_fd()
-        return buf
+        # Frames are copied whole on every write and read; ask for 2 MB pages
+        # to cut TLB misses. Only honoured where the kernel enables THP for
+        # shmem (transparent_hugepage/shmem_enabled = advise or always).
+        if len(mapped) >= HUGE_PAGE_SIZE and hasattr(mmap, "MADV_HUGEPAGE"):
+            try:
+                mapped.madvise(mmap.MADV_HUGEPAGE)
+            except OSError:
+                pass
+        return memoryview(mapped)
+
+    def _free_slot(self):
+        while True:
+            self.cnt_sem.acquire()
+            current = _COUNT.unpack_from(self.cnt)[0]
+            for slot in range(SharedFrame.SLOTS):
+                if slot != current and _COUNT.unpack_from(self.cnt, (1 + slot) * _COUNT.size)[0] == 0:
+                    self.cnt_sem.release()
+                    return slot
+            self.cnt_sem.release()
+            # Every other slot is still being copied by a slow reader
+            time.sleep(0.0005)
 
     def write(self, data, stm):
-        self.ram_sem.acquire()
-        self.ram[:] = data if isinstance(data, bytearray) else data.tobytes()
-        self.stm[:8] = stm.to_bytes(8, "little")
-        self.ram_sem.release()
+        slot, frame, raw, offset = self._slots[self._free_slot()]
+        if isinstance(data, np.ndarray) and (data.shape, data.dtype) == self._frame:
+            # Matches the declared frame: one strided copy, contiguous or not
+            np.copyto(frame, data, casting="no")
+        else:
+            try:
+                # Byte view of the caller's buffer, so the store below is the only copy
+                src = memoryview(data).cast("B")
+            except TypeError:
+                # Non-contiguous arrays of another shape need packing first
+                src = data.tobytes()
+            np.copyto(raw, np.frombuffer(src, np.uint8))
+        self._publish(slot, offset, stm)
+
+    @contextmanager
+    def frame(self, stm):
+        # Zero-copy write: yields the free slot as a typed array for the caller
+        # to fill in place; it is published when the with block exits cleanly
+        slot, frame, _, offset = self._slots[self._free_slot()]
+        yield frame
+        self._publish(slot, offset, stm)
+
+    def _publish(self, slot, offset, stm):
+        _STAMP.pack_into(self.stm, offset, stm)
+        self.cnt_sem.acquire()
+        _COUNT.pack_into(self.cnt, 0, slot)
+        self.cnt_sem.release()
+        # Snapshot under the lock, post outside it so signin/signout never wait on the fanout
         with self.sems_lock:
-            for k in list(self.sems.keys()):  # Create a copy of keys to avoid modification during iteration
-                if k in self.sems:  # Double-check key still exists
-                    if system != "Darwin":
-                        if self.sems[k].value > 0:
-                            continue
-                    self.sems[k].release()
-
-    def read(self, r_id):
+            targets = list(self.sems.values())
+        capped = system != "Darwin"
+        for sem in targets:
+            # A pending wake-up already covers the new frame; don't let counts pile up
+            if capped and sem.value > 0:
+                continue
+            sem.release()
+
+    def _pin(self):
+        self.cnt_sem.acquire()
+        slot = _COUNT.unpack_from(self.cnt)[0]
+        offset = (1 + slot) * _COUNT.size
+        _COUNT.pack_into(self.cnt, offset, _COUNT.unpack_from(self.cnt, offset)[0] + 1)
+        self.cnt_sem.release()
+        return slot
+
+    def _unpin(self, slot):
+        self.cnt_sem.acquire()
+        offset = (1 + slot) * _COUNT.size
+        _COUNT.pack_into(self.cnt, offset, _COUNT.unpack_from(self.cnt, offset)[0] - 1)
+        self.cnt_sem.release()
+
+    def _wait(self, r_id, timeout):
         # Check if the semaphore still exists before trying to acquire it
         with self.sems_lock:
             if r_id not in self.sems:
                 raise KeyError(f"Semaphore for reader {r_id} not found")
             sem = self.sems[r_id]
         
-        sem.acquire()
-        self.cnt_sem.acquire()
-        cnt = np.ndarray(shape=(1,), dtype=np.int32, buffer=self.cnt)
-        cnt += 1
-        if cnt == 1:
-            self.ram_sem.acquire()
-        self.cnt_sem.release()
-
-        data = np.ndarray(shape=self.shape, dtype=self.dtype, buffer=self.ram)
-        stm = int.from_bytes(self.stm[:8], "little")
-        self.cnt_sem.acquire()
-        cnt = np.ndarray(shape=(1,), dtype=np.int32, buffer=self.cnt)
-        cnt -= 1
-        if cnt.item() == 0:
-            self.ram_sem.release()
-        self.cnt_sem.release()
-        return (data.copy(), stm)
+        if not self._acquire(sem, timeout):
+            return False
+        if system == "Darwin":
+            # Writers can't cap the count here, so collapse queued wakeups for the latest frame
+            try:
+                while True:
+                    sem.acquire(0)
+            except BusyError:
+                pass
+        return True
+
+    @staticmethod
+    def _acquire(sem, timeout):
+        if timeout is None or timeout <= 0 or SEMAPHORE_TIMEOUT_SUPPORTED:
+            try:
+                sem.acquire(timeout)
+            except BusyError:
+                return False
+            return True
+        # No sem_timedwait (macOS): a timed acquire would block forever, so poll
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                sem.acquire(0)
+                return True
+            except BusyError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.001)
+
+    def attach_out(self, out):
+        # read() without its own `out` fills this buffer and returns it, so
+        # every frame lands in the same warm allocation; None detaches
+        self._out = out
+
+    def read(self, r_id, out=None, timeout=None):
+        if not self._wait(r_id, timeout):
+            return None
+        if out is None:
+            out = self._out
+        slot = self._pin()
+        frame, offset = self._ram_views[slot]
+        stm = _STAMP.unpack_from(self.stm, offset)[0]
+        # Copy while the slot is pinned; `out` lets the caller skip the extra buffer
+        if out is None:
+            out = frame.copy()
+        else:
+            np.copyto(out, frame, casting="no")
+        self._unpin(slot)
+        return (out, stm)
+
+    @contextmanager
+    def view(self, r_id, timeout=None):
+        # Zero-copy read: yields (frame, stm) over the shared slot, or None on
+        # timeout. The frame is only valid inside the with block.
+        if not self._wait(r_id, timeout):
+            yield None
+            return
+        slot = self._pin()
+        try:
+            frame, offset = self._ram_views[slot]
+            yield (frame, _STAMP.unpack_from(self.stm, offset)[0])
+        finally:
+            self._unpin(slot)
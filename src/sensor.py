@@ -1,5 +1,7 @@
 from .memory import SharedFrame
 from multiprocessing import Process
+import signal
+import threading
 import time
 import numpy as np
 import platform
@@ -12,6 +14,8 @@ class Sensor(Process):
         super(Sensor, self).__init__()
         self.running = True
         self.host = "192.168.1.80"
+        # FFmpeg hardware device for video decode, e.g. "cuda" or "vaapi"
+        self.hwaccel = None
 
     def run(self):
         self.config()
@@ -25,7 +29,42 @@ class Sensor(Process):
 
     def terminate(self):
         self.running = False
-        self.client.close()
+        # Only sensors that stream through an hl2ss receiver have a client
+        if hasattr(self, "client"):
+            self.client.close()
+
+
+class SensorHub(Process):
+    # Runs several sensors in one process, one thread each, so the interpreter
+    # and heavy imports (hl2ss, av, cv2, NDIlib) are paid once rather than per
+    # sensor. Socket reads, decoding and shared memory copies release the GIL.
+    def __init__(self, sensors) -> None:
+        super(SensorHub, self).__init__()
+        # Sensor classes or other picklable factories, e.g. partial(VLCCamera, 0)
+        self.sensors = list(sensors)
+
+    def run(self):
+        self.instances = [factory() for factory in self.sensors]
+        threads = [
+            threading.Thread(target=sensor.run, daemon=True)
+            for sensor in self.instances
+        ]
+        # terminate() from the parent sends SIGTERM: stop the sensors cleanly
+        # instead of dying with their clients open
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            if stop.wait(0.5):
+                break
+        for sensor in self.instances:
+            try:
+                sensor.terminate()
+            except Exception as e:
+                print(f"Error terminating {type(sensor).__name__}: {e}")
+        for thread in threads:
+            thread.join(timeout=1.0)
 
 
 class RandCamera(Sensor):
@@ -37,16 +76,14 @@ class RandCamera(Sensor):
         self.mem = SharedFrame(
             self.name, (self.height, self.width, 3), mode="w", dtype=self.dtype
         )
+        # Draws straight into uint8, no int64 temporary plus astype copy
+        self.rng = np.random.default_rng()
 
     def run(self):
         self.config()
+        shape = (self.height, self.width, 3)
         while self.running:
-            self.mem.write(
-                np.random.randint(0, 255, size=(self.height, self.width, 3)).astype(
-                    np.uint8
-                ),
-                0,
-            )
+            self.mem.write(self.rng.integers(0, 256, size=shape, dtype=np.uint8), 0)
 
 
 class RandMicrophone(Sensor):
@@ -55,16 +92,14 @@ class RandMicrophone(Sensor):
         self.shape = [2, 1024]
         self.dtype = "float32"
         self.mem = SharedFrame(self.name, self.shape, mode="w", dtype=self.dtype)
+        self.rng = np.random.default_rng()
+        self.buffer = np.empty(self.shape, dtype=self.dtype)
 
     def run(self):
         self.config()
         while self.running:
-            self.mem.write(
-                np.random.randint(0, 255, size=(self.height, self.width, 3)).astype(
-                    np.uint8
-                ),
-                0,
-            )
+            self.rng.standard_normal(dtype=np.float32, out=self.buffer)
+            self.mem.write(self.buffer, 0)
             time.sleep(0.2)
 
 
@@ -87,17 +122,20 @@ class RGBCamera(Sensor):
         self.framerate = 30
         self.profile = hl2ss.VideoProfile.H265_MAIN
         self.bitrate = 5 * 1024 * 1024
-        self.client = hl2ss.rx_pv(
-            self.host,
-            self.port,
-            hl2ss.ChunkSize.PERSONAL_VIDEO,
-            self.mode,
-            self.width,
-            self.height,
-            self.framerate,
-            self.profile,
-            self.bitrate,
-            "bgr24",
+        self.client = hl2ss.rx_async(
+            hl2ss.rx_pv(
+                self.host,
+                self.port,
+                hl2ss.ChunkSize.PERSONAL_VIDEO,
+                self.mode,
+                self.width,
+                self.height,
+                self.framerate,
+                self.profile,
+                self.bitrate,
+                "bgr24",
+                self.hwaccel,
+            )
         )
         self.mem = SharedFrame(
             self.name, (self.height, self.width, 3), mode="w", dtype=self.dtype
@@ -124,14 +162,17 @@ class VLCCamera(Sensor):
         self.profile = hl2ss.VideoProfile.H265_MAIN
         self.bitrate = 1 * 1024 * 1024
         self.dtype = "uint8"
-        self.client = hl2ss.rx_rm_vlc(
-            self.host,
-            port,
-            hl2ss.ChunkSize.RM_VLC,
-            self.mode,
-            self.profile,
-            self.bitrate,
-            "bgr24",
+        self.client = hl2ss.rx_async(
+            hl2ss.rx_rm_vlc(
+                self.host,
+                port,
+                hl2ss.ChunkSize.RM_VLC,
+                self.mode,
+                self.profile,
+                self.bitrate,
+                "bgr24",
+                self.hwaccel,
+            )
         )
         self.mem = SharedFrame(self.name, (480, 640, 3), mode="w", dtype=self.dtype)
 
@@ -154,8 +195,10 @@ class DepthCamera(Sensor):
         self.client.open()
         while self.running:
             data = self.client.get_next_packet()
-            self.mem["depth"].write(data.payload.depth, data.timestamp)
-            self.mem["ab"].write(data.payload.ab, data.timestamp)
+            # Same-width reinterpret of the uint16 views, so each write is a
+            # single strided copy into shared memory instead of tobytes + copy
+            self.mem["depth"].write(data.payload.depth.view(np.int16), data.timestamp)
+            self.mem["ab"].write(data.payload.ab.view(np.int16), data.timestamp)
 
 
 class IMU(Sensor):
@@ -201,16 +244,23 @@ class Microphone(Sensor):
         # self.shape = [1, 2048]
         # self.dtype = "float32"
         self.dtype = "int16"
-        self.client = hl2ss.rx_mc(
-            self.host,
-            hl2ss.StreamPort.MICROPHONE,
-            hl2ss.ChunkSize.MICROPHONE,
-            hl2ss.AudioProfile.AAC_24000,
+        self.client = hl2ss.rx_async(
+            hl2ss.rx_mc(
+                self.host,
+                hl2ss.StreamPort.MICROPHONE,
+                hl2ss.ChunkSize.MICROPHONE,
+                hl2ss.AudioProfile.AAC_24000,
+            )
         )
         self.mem = SharedFrame(self.name, self.shape, mode="w", dtype=self.dtype)
 
 
 class Mevo(Sensor):
+    def __init__(self) -> None:
+        super().__init__()
+        # 3: BGR, 4: NDI's BGRX as received (plain copy, no repack; alpha is padding)
+        self.channels = 3
+
     def ndi_init(self):
         if system == "Darwin":
             return 0
@@ -221,25 +271,31 @@ class Mevo(Sensor):
         ndi_find = ndi.find_create_v2()
         if ndi_find is None:
             return 0
-        for i in range(10):
-            ndi.find_wait_for_sources(ndi_find, 1000)
+        target_source = None
+        deadline = time.monotonic() + 10
+        while target_source is None and time.monotonic() < deadline:
+            # Blocks until the source list changes or the deadline passes
+            ndi.find_wait_for_sources(
+                ndi_find, max(0, int((deadline - time.monotonic()) * 1000))
+            )
             sources = ndi.find_get_current_sources(ndi_find)
-            try:
-                # target_source = [sources[i] for i, s in enumerate(sources) if self.camera_id in s.ndi_name][0]
-                target_source = [
-                    sources[i]
-                    for i, s in enumerate(sources)
-                    if "MEVO" in s.ndi_name and "PJ5" in s.ndi_name
-                ][0]
-                break
-            except:
+            # target_source = next((s for s in sources if self.camera_id in s.ndi_name), None)
+            target_source = next(
+                (s for s in sources if "MEVO" in s.ndi_name and "PJ5" in s.ndi_name),
+                None,
+            )
+            if target_source is None:
                 print(f"Found {len(sources)} cameras but not match")
+        if target_source is None:
+            ndi.find_destroy(ndi_find)
+            return 0
         ndi_recv_create = ndi.RecvCreateV3()
         ndi_recv_create.color_format = ndi.RECV_COLOR_FORMAT_BGRX_BGRA
         ndi_recv = ndi.recv_create_v3(ndi_recv_create)
         ndi.recv_connect(ndi_recv, target_source)
         ndi.find_destroy(ndi_find)
         self.ndi_recv = ndi_recv
+        return 1
 
     def config(self):
         # self.width = 1280
@@ -251,7 +307,10 @@ class Mevo(Sensor):
         self.name = "mevo"
         self.mem = {}
         self.mem["video"] = SharedFrame(
-            "mevo-video", (self.height, self.width, 3), mode="w", dtype=self.dtype
+            "mevo-video",
+            (self.height, self.width, self.channels),
+            mode="w",
+            dtype=self.dtype,
         )
         self.mem["audio"] = SharedFrame(
             "mevo-audio", (2, 1024), mode="w", dtype="float32"
@@ -261,40 +320,38 @@ class Mevo(Sensor):
         if system == "Darwin":
             return
         import NDIlib as ndi
+        import cv2
 
-        self.ndi_init()
+        if not self.ndi_init():
+            print("Mevo: no matching NDI source, not starting")
+            return
         self.config()
-        start = time.time()
-        count = 0
+        start = last_log = time.monotonic()
         while self.running:
-            count += 1
-            if count % 100 == 0:
-                print(f"running {time.time()-start:.2f} second")
+            # Progress by wall clock, so the log rate doesn't follow the frame rate
+            now = time.monotonic()
+            if now - last_log >= 5:
+                print(f"running {now-start:.2f} second")
+                last_log = now
 
             t, v, a, _ = ndi.recv_capture_v2(self.ndi_recv, 1000)
             if t == ndi.FRAME_TYPE_VIDEO:
-                frame = np.copy(v.data[:, :, :-1])
-                ndi.recv_free_video_v2(self.ndi_recv, v)
-                self.mem["video"].write(frame, 0)
-                continue
-            if t == ndi.FRAME_TYPE_AUDIO:
-                # audio = np.copy(a.data)
-                # data = np.zeros((a.no_channels, a.no_samples), np.int16)
-                # interleaved = ndi.AudioFrameInterleaved16s()
-                # interleaved.data = data
-                # ndi.util_audio_to_interleaved_16s_v2(a, interleaved)
-                # # timeout = interleaved.no_samples * 20 / interleaved.sample_rate
-                # audio = data
-                # ndi.recv_free_audio_v2(self.ndi_recv, a)
-                self.mem["audio"].write(a.data, 0)
-
-                # print('Audio data received (%d samples).' % a.no_samples)
-            if t == ndi.FRAME_TYPE_VIDEO:
-                frame = np.copy(v.data[:, :, :-1])
+                if v.data.shape[:2] != (self.height, self.width):
+                    shape = v.data.shape[:2]
+                    ndi.recv_free_video_v2(self.ndi_recv, v)
+                    raise ValueError(
+                        f"Mevo: NDI frame is {shape}, expected {(self.height, self.width)}"
+                    )
+                # Pack BGRX straight into the shared slot, the only pass over the pixels.
+                # An exception inside the block leaves the slot unpublished.
+                with self.mem["video"].frame(0) as frame:
+                    if self.channels == 4:
+                        np.copyto(frame, v.data, casting="no")
+                    elif cv2.cvtColor(v.data, cv2.COLOR_BGRA2BGR, dst=frame) is not frame:
+                        # cv2 allocates a new output instead of failing on a mismatched dst
+                        raise ValueError("Mevo: BGRX frame was not packed into the shared slot")
                 ndi.recv_free_video_v2(self.ndi_recv, v)
-                self.mem["video"].write(frame, 0)
-                continue
-            if t == ndi.FRAME_TYPE_AUDIO:
+            elif t == ndi.FRAME_TYPE_AUDIO:
                 # audio = np.copy(a.data)
                 # data = np.zeros((a.no_channels, a.no_samples), np.int16)
                 # interleaved = ndi.AudioFrameInterleaved16s()
@@ -304,5 +361,6 @@ class Mevo(Sensor):
                 # audio = data
                 # ndi.recv_free_audio_v2(self.ndi_recv, a)
                 self.mem["audio"].write(a.data, 0)
+                ndi.recv_free_audio_v2(self.ndi_recv, a)
 
                 # print('Audio data received (%d samples).' % a.no_samples)